@@ -18,7 +18,11 @@ from home.src.download.subscriptions import PlaylistSubscription
 from home.src.es.connect import IndexPaginate
 from home.src.index.channel import YoutubeChannel
 from home.src.index.playlist import YoutubePlaylist
-from home.src.index.video import YoutubeVideo, index_new_video
+from home.src.index.video import (
+    SUBTITLE_BULK,
+    YoutubeVideo,
+    index_new_video,
+)
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import clean_string, ignore_filelist
 from home.src.ta.ta_redis import RedisArchivist, RedisQueue
@@ -55,7 +59,11 @@ class VideoDownloader:
             except yt_dlp.utils.DownloadError:
                 print("failed to download " + youtube_id)
                 continue
-            vid_dict = index_new_video(youtube_id)
+            try:
+                vid_dict = index_new_video(youtube_id)
+            finally:
+                # downloads are slow, don't hold subtitles across videos
+                SUBTITLE_BULK.flush()
             self.channels.add(vid_dict["channel"]["channel_id"])
             self.move_to_archive(vid_dict)
             self._delete_from_pending(youtube_id)
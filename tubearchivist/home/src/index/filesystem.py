@@ -16,7 +16,7 @@ import requests
 from home.src.download.queue import PendingList
 from home.src.download.yt_dlp_handler import VideoDownloader
 from home.src.index.reindex import Reindex
-from home.src.index.video import index_new_video
+from home.src.index.video import SUBTITLE_BULK, index_new_video
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import clean_string, ignore_filelist
 from home.src.ta.ta_redis import RedisArchivist
@@ -238,30 +238,38 @@ class ManualImport:
 
         all_videos_added = []
 
-        for media_file in self.identified:
-            json_file = media_file["json_file"]
-            video_file = media_file["video_file"]
-            youtube_id = media_file["youtube_id"]
+        try:
+            for media_file in self.identified:
+                all_videos_added.append(self._import_single(media_file))
+        finally:
+            SUBTITLE_BULK.flush()
 
-            video_path = os.path.join(self.CACHE_DIR, "import", video_file)
+        return all_videos_added
 
-            self.move_to_cache(video_path, youtube_id)
+    def _import_single(self, media_file):
+        """import single identified media file, return thumb tuple"""
+        json_file = media_file["json_file"]
+        video_file = media_file["video_file"]
+        youtube_id = media_file["youtube_id"]
 
-            # identify and archive
-            vid_dict = index_new_video(youtube_id)
-            VideoDownloader([youtube_id]).move_to_archive(vid_dict)
-            youtube_id = vid_dict["youtube_id"]
-            thumb_url = vid_dict["vid_thumb_url"]
-            all_videos_added.append((youtube_id, thumb_url))
+        video_path = os.path.join(self.CACHE_DIR, "import", video_file)
 
-            # cleanup
-            if os.path.exists(video_path):
-                os.remove(video_path)
-            if json_file:
-                json_path = os.path.join(self.CACHE_DIR, "import", json_file)
-                os.remove(json_path)
+        self.move_to_cache(video_path, youtube_id)
 
-        return all_videos_added
+        # identify and archive
+        vid_dict = index_new_video(youtube_id)
+        VideoDownloader([youtube_id]).move_to_archive(vid_dict)
+        youtube_id = vid_dict["youtube_id"]
+        thumb_url = vid_dict["vid_thumb_url"]
+
+        # cleanup
+        if os.path.exists(video_path):
+            os.remove(video_path)
+        if json_file:
+            json_path = os.path.join(self.CACHE_DIR, "import", json_file)
+            os.remove(json_path)
+
+        return (youtube_id, thumb_url)
 
     def move_to_cache(self, video_path, youtube_id):
         """move identified video file to cache, convert to mp4"""
@@ -310,9 +318,12 @@ def scan_filesystem():
         filesystem_handler.delete_from_index()
     if filesystem_handler.to_index:
         print("index new videos")
-        for missing_vid in filesystem_handler.to_index:
-            youtube_id = missing_vid[2]
-            index_new_video(youtube_id)
+        try:
+            for missing_vid in filesystem_handler.to_index:
+                youtube_id = missing_vid[2]
+                index_new_video(youtube_id)
+        finally:
+            SUBTITLE_BULK.flush()
 
 
 def reindex_old_documents():
@@ -15,7 +15,7 @@ from home.src.download.subscriptions import ChannelSubscription
 from home.src.download.thumbnails import ThumbManager
 from home.src.index.channel import YoutubeChannel
 from home.src.index.playlist import YoutubePlaylist
-from home.src.index.video import YoutubeVideo
+from home.src.index.video import SUBTITLE_BULK, YoutubeVideo
 from home.src.ta.config import AppConfig
 from home.src.ta.helper import get_total_hits
 
@@ -200,13 +200,14 @@ class Reindex:
         channel_dict = video.json_data["channel"]
         playlist = video.json_data.get("playlist")
 
+        # delete before build_json queues new subtitles for indexing
+        video.delete_subtitles()
         # get new
         video.build_json()
         if not video.youtube_meta:
             video.deactivate()
             return
 
-        video.delete_subtitles()
         # add back
         video.json_data["player"] = player
         video.json_data["date_downloaded"] = date_downloaded
@@ -253,10 +254,13 @@ class Reindex:
         """reindex what's needed"""
         # videos
         print(f"reindexing {len(self.all_youtube_ids)} videos")
-        for youtube_id in self.all_youtube_ids:
-            self.reindex_single_video(youtube_id)
-            if self.sleep_interval:
-                sleep(self.sleep_interval)
+        try:
+            for youtube_id in self.all_youtube_ids:
+                self.reindex_single_video(youtube_id)
+                if self.sleep_interval:
+                    sleep(self.sleep_interval)
+        finally:
+            SUBTITLE_BULK.flush()
         # channels
         print(f"reindexing {len(self.all_channel_ids)} channels")
         for channel_id in self.all_channel_ids:
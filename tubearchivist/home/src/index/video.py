@@ -4,18 +4,26 @@ functionality:
 - index and update in es
 """
 
-import json
 import os
 import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
+import orjson
 import requests
 from home.src.es.connect import ElasticWrap
 from home.src.index import channel as ta_channel
 from home.src.index.generic import YouTubeItem
 from home.src.ta.helper import DurationConverter, clean_string
+from home.src.ta.ta_redis import RedisArchivist
 from ryd_client import ryd_client
 
+# channel names repeat for every video of a channel, titles don't
+cached_clean_string = lru_cache(maxsize=256)(clean_string)
+
 
 class YoutubeSubtitle:
     """handle video subtitle functionality"""
@@ -23,6 +31,8 @@ class YoutubeSubtitle:
     def __init__(self, video):
         self.video = video
         self.languages = False
+        self.normalized = False
+        self.media_base = False
 
     def sub_conf_parse(self):
         """add additional conf values to self"""
@@ -37,6 +47,9 @@ class YoutubeSubtitle:
             # no subtitles
             return False
 
+        video_media_url = self.video.json_data["media_url"]
+        self.media_base = os.path.splitext(video_media_url)[0]
+
         relevant_subtitles = []
         for lang in self.languages:
             user_sub = self.get_user_subtitles(lang)
@@ -59,13 +72,15 @@ class YoutubeSubtitle:
         if not all_subtitles:
             return False
 
-        video_media_url = self.video.json_data["media_url"]
-        media_url = video_media_url.replace(".mp4", f"-{lang}.vtt")
+        media_url = f"{self.media_base}-{lang}.vtt"
         all_formats = all_subtitles.get(lang)
         if not all_formats:
             return False
 
-        subtitle = [i for i in all_formats if i["ext"] == "vtt"][0]
+        subtitle = next((i for i in all_formats if i["ext"] == "vtt"), False)
+        if not subtitle:
+            return False
+
         subtitle.update(
             {"lang": lang, "source": "auto", "media_url": media_url}
         )
@@ -74,19 +89,20 @@ class YoutubeSubtitle:
 
     def _normalize_lang(self):
         """normalize country specific language keys"""
+        if self.normalized:
+            return self.normalized
+
         all_subtitles = self.video.youtube_meta.get("subtitles")
         if not all_subtitles:
             return False
 
-        all_keys = list(all_subtitles.keys())
-        for key in all_keys:
-            lang = key.split("-")[0]
-            old = all_subtitles.pop(key)
-            if lang == "live_chat":
-                continue
-            all_subtitles[lang] = old
+        self.normalized = {
+            key.split("-")[0]: value
+            for key, value in all_subtitles.items()
+            if key != "live_chat"
+        }
 
-        return all_subtitles
+        return self.normalized
 
     def get_user_subtitles(self, lang):
         """get subtitles uploaded from channel owner"""
@@ -95,14 +111,16 @@ class YoutubeSubtitle:
         if not all_subtitles:
             return False
 
-        video_media_url = self.video.json_data["media_url"]
-        media_url = video_media_url.replace(".mp4", f"-{lang}.vtt")
+        media_url = f"{self.media_base}-{lang}.vtt"
         all_formats = all_subtitles.get(lang)
         if not all_formats:
             # no user subtitles found
             return False
 
-        subtitle = [i for i in all_formats if i["ext"] == "vtt"][0]
+        subtitle = next((i for i in all_formats if i["ext"] == "vtt"), False)
+        if not subtitle:
+            return False
+
         subtitle.update(
             {"lang": lang, "source": "user", "media_url": media_url}
         )
@@ -112,10 +130,15 @@ class YoutubeSubtitle:
     def download_subtitles(self, relevant_subtitles):
         """download subtitle files to archive"""
         videos_base = self.video.config["application"]["videos"]
-        for subtitle in relevant_subtitles:
+        all_urls = [i["url"] for i in relevant_subtitles]
+        # fetch all languages in parallel, reuse connection to same host
+        with requests.Session() as session:
+            with ThreadPoolExecutor(max_workers=len(all_urls)) as executor:
+                all_responses = list(executor.map(session.get, all_urls))
+
+        for subtitle, response in zip(relevant_subtitles, all_responses):
             dest_path = os.path.join(videos_base, subtitle["media_url"])
             source = subtitle["source"]
-            response = requests.get(subtitle["url"])
             if not response.ok:
                 print(f"{self.video.youtube_id}: failed to download subtitle")
                 continue
@@ -138,143 +161,235 @@ class YoutubeSubtitle:
 
     @staticmethod
     def _index_subtitle(query_str):
-        """send subtitle to es for indexing"""
+        """queue subtitle for indexing, sent to es in batches"""
+        SUBTITLE_BULK.append(query_str)
+
+
+class SubtitleBulkBuffer:
+    """collect subtitle bulk queries across videos
+    flush to es when buffer is big enough or at end of batch
+    """
+
+    MAX_SIZE = 10 * 1024 * 1024
+    # one query per video and language
+    MAX_COUNT = 50
+
+    def __init__(self):
+        self.all_queries = []
+        self.size = 0
+
+    def append(self, query_str):
+        """add ndjson query bytes, flush if buffer is full"""
+        query_str = query_str.strip(b"\n")
+        if not query_str:
+            return
+
+        self.all_queries.append(query_str)
+        self.size += len(query_str)
+        too_big = self.size >= self.MAX_SIZE
+        if too_big or len(self.all_queries) >= self.MAX_COUNT:
+            self.flush()
+
+    def flush(self):
+        """send all buffered queries to es in one bulk request"""
+        if not self.all_queries:
+            return
+
+        query_str = b"\n".join(self.all_queries) + b"\n"
+        self.all_queries = []
+        self.size = 0
         _, _ = ElasticWrap("_bulk").post(data=query_str, ndjson=True)
 
 
+SUBTITLE_BULK = SubtitleBulkBuffer()
+
+
 class SubtitleParser:
     """parse subtitle str from youtube"""
 
-    time_reg = r"^([0-9]{2}:?){3}\.[0-9]{3} --> ([0-9]{2}:?){3}\.[0-9]{3}"
-    stamp_reg = r"<([0-9]{2}:?){3}\.[0-9]{3}>"
-    tag_reg = r"</?c>"
+    time_reg = re.compile(
+        r"^([0-9]{2}):([0-9]{2}):([0-9]{2})\.([0-9]{3}) --> "
+        r"([0-9]{2}):([0-9]{2}):([0-9]{2})\.([0-9]{3})"
+    )
+    # inline word timestamps and their <c> tags, removed in one pass
+    markup_reg = re.compile(r"<([0-9]{2}:?){3}\.[0-9]{3}>|</?c>")
+    # ids are alphanumeric, no need to json.dumps a new dict per cue
+    BULK_ACTION = '{{"index": {{"_index": "ta_subtitle", "_id": "{}"}}}}'
 
     def __init__(self, subtitle_str, lang):
         self.subtitle_str = subtitle_str
         self.lang = lang
         self.header = False
-        self.parsed_cue_list = False
+        # parallel lists, one entry per cue, timestamps in ms
+        self.cue_starts = False
+        self.cue_ends = False
+        self.cue_lines = False
+        self.line_index = False
         self.all_text_lines = False
+        self.recent_lines = False
+        self.recent_set = False
         self.matched = False
 
     def process(self):
         """collection to process subtitle string"""
         self._parse_cues()
         self._match_text_lines()
-        self._add_id()
         self._timestamp_check()
 
     def _parse_cues(self):
         """split into cues"""
         all_cues = self.subtitle_str.replace("\n \n", "\n").split("\n\n")
         self.header = all_cues[0]
+        self.cue_starts = []
+        self.cue_ends = []
+        self.cue_lines = []
         self.all_text_lines = []
-        self.parsed_cue_list = [self._cue_cleaner(i) for i in all_cues[1:]]
+        self.recent_lines = deque(maxlen=4)
+        self.recent_set = set()
+        for cue in all_cues[1:]:
+            self._cue_cleaner(cue)
+
+        self._build_line_index()
+
+    def _build_line_index(self):
+        """map each text line to the index of cues it appears in"""
+        self.line_index = {}
+        for idx, lines in enumerate(self.cue_lines):
+            for line in lines:
+                cue_idxs = self.line_index.setdefault(line, [])
+                if not cue_idxs or cue_idxs[-1] != idx:
+                    cue_idxs.append(idx)
 
     def _cue_cleaner(self, cue):
         """parse single cue"""
-        all_lines = cue.split("\n")
-        cue_dict = {"lines": []}
-
-        for line in all_lines:
-            if re.match(self.time_reg, line):
-                clean = re.search(self.time_reg, line).group()
-                start, end = clean.split(" --> ")
-                cue_dict.update({"start": start, "end": end})
+        start = end = 0
+        lines = []
+
+        for line in cue.split("\n"):
+            time_match = self.time_reg.match(line)
+            if time_match:
+                groups = time_match.groups()
+                start = self._stamp_to_ms(*groups[:4])
+                end = self._stamp_to_ms(*groups[4:])
             else:
-                clean = re.sub(self.stamp_reg, "", line)
-                clean = re.sub(self.tag_reg, "", clean)
-                cue_dict["lines"].append(clean)
-                if clean.strip() and clean not in self.all_text_lines[-4:]:
-                    # remove immediate duplicates
-                    self.all_text_lines.append(clean)
+                if "<" in line:
+                    clean = self.markup_reg.sub("", line)
+                else:
+                    clean = line
+                lines.append(clean)
+                # remove immediate duplicates, ignore spacing
+                dedup_key = " ".join(clean.split())
+                if dedup_key and dedup_key not in self.recent_set:
+                    self._add_text_line(clean, dedup_key)
+
+        self.cue_starts.append(start)
+        self.cue_ends.append(end)
+        self.cue_lines.append(lines)
+
+    @staticmethod
+    def _stamp_to_ms(hours, minutes, seconds, millis):
+        """convert matched timestamp parts to milliseconds"""
+        total_sec = (int(hours) * 60 + int(minutes)) * 60 + int(seconds)
+        return total_sec * 1000 + int(millis)
 
-        return cue_dict
+    @staticmethod
+    def _ms_to_stamp(total_ms):
+        """convert milliseconds back to HH:MM:SS.mmm timestamp"""
+        total_sec, millis = divmod(total_ms, 1000)
+        total_min, seconds = divmod(total_sec, 60)
+        hours, minutes = divmod(total_min, 60)
+        return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{millis:03d}"
+
+    def _add_text_line(self, clean, dedup_key):
+        """add line to all_text_lines, remember last four for dedup"""
+        if len(self.recent_lines) == self.recent_lines.maxlen:
+            self.recent_set.discard(self.recent_lines[0])
+
+        self.recent_lines.append(dedup_key)
+        self.recent_set.add(dedup_key)
+        self.all_text_lines.append(clean)
 
     def _match_text_lines(self):
         """match unique text lines with timestamps"""
 
         self.matched = []
+        # ordered and unique, delete in constant time
+        pending = dict.fromkeys(self.all_text_lines)
 
-        while self.all_text_lines:
-            check = self.all_text_lines[0]
-            matches = [i for i in self.parsed_cue_list if check in i["lines"]]
-            new_cue = matches[-1]
-            new_cue["start"] = matches[0]["start"]
+        while pending:
+            check = next(iter(pending))
+            matches = self.line_index[check]
+            new_idx = matches[-1]
+            self.cue_starts[new_idx] = self.cue_starts[matches[0]]
 
-            for line in new_cue["lines"]:
-                try:
-                    self.all_text_lines.remove(line)
-                except ValueError:
-                    continue
+            for line in self.cue_lines[new_idx]:
+                pending.pop(line, None)
 
-            self.matched.append(new_cue)
+            self.matched.append(new_idx)
 
     def _timestamp_check(self):
         """check if end timestamp is bigger than start timestamp"""
-        for idx, cue in enumerate(self.matched):
-            # this
-            end = int(re.sub("[^0-9]", "", cue.get("end")))
-            # next
-            try:
-                next_cue = self.matched[idx + 1]
-            except IndexError:
-                continue
-
-            start_next = int(re.sub("[^0-9]", "", next_cue.get("start")))
-            if end > start_next:
-                self.matched[idx]["end"] = next_cue.get("start")
+        starts = self.cue_starts
+        ends = self.cue_ends
+        for idx, next_idx in zip(self.matched, self.matched[1:]):
+            if ends[idx] > starts[next_idx]:
+                ends[idx] = starts[next_idx]
+
+    def _build_matched(self):
+        """build list of matched cue dicts with id"""
+        all_matched = []
+        for cue_id, idx in enumerate(self.matched, start=1):
+            cue = {
+                "id": cue_id,
+                "start": self._ms_to_stamp(self.cue_starts[idx]),
+                "end": self._ms_to_stamp(self.cue_ends[idx]),
+                "lines": self.cue_lines[idx],
+            }
+            all_matched.append(cue)
 
-    def _add_id(self):
-        """add id to matched cues"""
-        for idx, _ in enumerate(self.matched):
-            self.matched[idx]["id"] = idx + 1
+        return all_matched
 
     def get_subtitle_str(self):
         """stitch cues and return processed new string"""
-        new_subtitle_str = self.header + "\n\n"
+        all_parts = [self.header, "\n\n"]
 
-        for cue in self.matched:
-            timestamp = f"{cue.get('start')} --> {cue.get('end')}"
-            lines = "\n".join(cue.get("lines"))
-            cue_text = f"{cue.get('id')}\n{timestamp}\n{lines}\n\n"
-            new_subtitle_str = new_subtitle_str + cue_text
+        for cue in self._build_matched():
+            timestamp = f"{cue['start']} --> {cue['end']}"
+            lines = "\n".join(cue["lines"])
+            all_parts.append(f"{cue['id']}\n{timestamp}\n{lines}\n\n")
 
-        return new_subtitle_str
+        return "".join(all_parts)
 
     def create_bulk_import(self, video, source):
         """process matched for es import"""
         bulk_list = []
-        channel = video.json_data.get("channel")
+        channel = video.json_data["channel"]
 
         document = {
             "youtube_id": video.youtube_id,
-            "title": video.json_data.get("title"),
-            "subtitle_channel": channel.get("channel_name"),
-            "subtitle_channel_id": channel.get("channel_id"),
-            "subtitle_last_refresh": int(datetime.now().strftime("%s")),
+            "title": video.json_data["title"],
+            "subtitle_channel": channel["channel_name"],
+            "subtitle_channel_id": channel["channel_id"],
+            "subtitle_last_refresh": int(time.time()),
             "subtitle_lang": self.lang,
             "subtitle_source": source,
         }
 
-        for match in self.matched:
-            match_id = match.get("id")
-            document_id = f"{video.youtube_id}-{self.lang}-{match_id}"
-            action = {"index": {"_index": "ta_subtitle", "_id": document_id}}
-            document.update(
-                {
-                    "subtitle_fragment_id": document_id,
-                    "subtitle_start": match.get("start"),
-                    "subtitle_end": match.get("end"),
-                    "subtitle_index": match_id,
-                    "subtitle_line": " ".join(match.get("lines")),
-                }
-            )
-            bulk_list.append(json.dumps(action))
-            bulk_list.append(json.dumps(document))
+        id_prefix = f"{video.youtube_id}-{self.lang}-"
+
+        for match in self._build_matched():
+            match_id = match["id"]
+            document_id = f"{id_prefix}{match_id}"
+            document["subtitle_fragment_id"] = document_id
+            document["subtitle_start"] = match["start"]
+            document["subtitle_end"] = match["end"]
+            document["subtitle_index"] = match_id
+            document["subtitle_line"] = " ".join(match["lines"])
+            bulk_list.append(self.BULK_ACTION.format(document_id).encode())
+            bulk_list.append(orjson.dumps(document))
 
-        bulk_list.append("\n")
-        query_str = "\n".join(bulk_list)
+        bulk_list.append(b"\n")
+        query_str = b"\n".join(bulk_list)
 
         return query_str
 
@@ -285,6 +400,7 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
     es_path = False
     index_name = "ta_video"
     yt_base = "https://www.youtube.com/watch?v="
+    ryd_cache_expire = 7 * 24 * 60 * 60
 
     def __init__(self, youtube_id):
         super().__init__(youtube_id)
@@ -310,19 +426,19 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
 
     def _process_youtube_meta(self):
         """extract relevant fields from youtube"""
+        meta = self.youtube_meta
         # extract
-        self.channel_id = self.youtube_meta["channel_id"]
-        upload_date = self.youtube_meta["upload_date"]
-        upload_date_time = datetime.strptime(upload_date, "%Y%m%d")
+        self.channel_id = meta["channel_id"]
+        upload_date_time = datetime.strptime(meta["upload_date"], "%Y%m%d")
         published = upload_date_time.strftime("%Y-%m-%d")
-        last_refresh = int(datetime.now().strftime("%s"))
+        last_refresh = int(time.time())
         # build json_data basics
         self.json_data = {
-            "title": self.youtube_meta["title"],
-            "description": self.youtube_meta["description"],
-            "category": self.youtube_meta["categories"],
-            "vid_thumb_url": self.youtube_meta["thumbnail"],
-            "tags": self.youtube_meta["tags"],
+            "title": meta["title"],
+            "description": meta["description"],
+            "category": meta["categories"],
+            "vid_thumb_url": meta["thumbnail"],
+            "tags": meta["tags"],
             "published": published,
             "vid_last_refresh": last_refresh,
             "date_downloaded": last_refresh,
@@ -338,31 +454,32 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
 
     def _add_stats(self):
         """add stats dicst to json_data"""
-        # likes
-        like_count = self.youtube_meta.get("like_count", 0)
-        dislike_count = self.youtube_meta.get("dislike_count", 0)
-        self.json_data.update(
-            {
-                "stats": {
-                    "view_count": self.youtube_meta["view_count"],
-                    "like_count": like_count,
-                    "dislike_count": dislike_count,
-                    "average_rating": self.youtube_meta["average_rating"],
-                }
-            }
-        )
+        meta = self.youtube_meta
+        self.json_data["stats"] = {
+            "view_count": meta["view_count"],
+            "like_count": meta.get("like_count", 0),
+            "dislike_count": meta.get("dislike_count", 0),
+            "average_rating": meta["average_rating"],
+        }
 
     def build_dl_cache_path(self):
         """find video path in dl cache"""
         cache_dir = self.app_conf["cache_dir"]
         cache_path = f"{cache_dir}/download/"
-        all_cached = os.listdir(cache_path)
-        for file_cached in all_cached:
-            if self.youtube_id in file_cached:
-                vid_path = os.path.join(cache_path, file_cached)
-                return vid_path
+        vid_path = self._find_media_file(cache_path)
+        if not vid_path:
+            raise FileNotFoundError
+
+        return vid_path
 
-        raise FileNotFoundError
+    def _find_media_file(self, folder):
+        """scan folder for first file matching youtube_id"""
+        with os.scandir(folder) as all_entries:
+            for entry in all_entries:
+                if self.youtube_id in entry.name:
+                    return entry.path
+
+        return False
 
     def add_player(self):
         """add player information for new videos"""
@@ -373,12 +490,8 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
             # when reindexing needs to handle title rename
             channel = os.path.split(self.json_data["media_url"])[0]
             channel_dir = os.path.join(self.app_conf["videos"], channel)
-            all_files = os.listdir(channel_dir)
-            for file in all_files:
-                if self.youtube_id in file:
-                    vid_path = os.path.join(channel_dir, file)
-                    break
-            else:
+            vid_path = self._find_media_file(channel_dir)
+            if not vid_path:
                 raise FileNotFoundError("could not find video file") from err
 
         duration_handler = DurationConverter()
@@ -397,7 +510,7 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
     def add_file_path(self):
         """build media_url for where file will be located"""
         channel_name = self.json_data["channel"]["channel_name"]
-        clean_channel_name = clean_string(channel_name)
+        clean_channel_name = cached_clean_string(channel_name)
         if len(clean_channel_name) <= 3:
             # fall back to channel id
             clean_channel_name = self.json_data["channel"]["channel_id"]
@@ -429,12 +542,22 @@ class YoutubeVideo(YouTubeItem, YoutubeSubtitle):
 
     def _get_ryd_stats(self):
         """get optional stats from returnyoutubedislikeapi.com"""
-        try:
-            print(f"{self.youtube_id}: get ryd stats")
-            result = ryd_client.get(self.youtube_id)
-        except requests.exceptions.ConnectionError:
-            print(f"{self.youtube_id}: failed to query ryd api, skipping")
-            return False
+        redis_archivist = RedisArchivist()
+        cache_key = f"ryd:{self.youtube_id}"
+        result = redis_archivist.get_message(cache_key)
+        if not result["status"]:
+            try:
+                print(f"{self.youtube_id}: get ryd stats")
+                result = ryd_client.get(self.youtube_id)
+            except requests.exceptions.ConnectionError:
+                print(f"{self.youtube_id}: failed to query ryd api, skipping")
+                return False
+
+            if result["status"] == 200:
+                # only cache hits, unknown videos get retried next time
+                redis_archivist.set_message(
+                    cache_key, result, expire=self.ryd_cache_expire
+                )
 
         if result["status"] == 404:
             return False